@@ -1,23 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import pandas
-import webis
+import os
+import sys
 
-
-def main():
-    tweets = pandas.read_csv("sample_data.csv")
-
-    sentiment = webis.SentimentIdentifier().identifySentiment(
-        tweets[["tweetId", "text"]]
-    )
-
-    tweets.set_index("tweetId", inplace=True)
-    sentiment.set_index("tweetId", inplace=True)
-    tweets = tweets.join(sentiment)
-
-    tweets.to_csv("sample_data_with_sentiment.csv")
+# the sentiment detection is implemented in somecon/sentiment.py
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+from somecon.cli import main  # noqa: E402
 
 
 if __name__ == "__main__":
-    main()
+    # same as `python -m somecon sentiment`
+    main(["sentiment"] + sys.argv[1:])
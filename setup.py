@@ -0,0 +1,21 @@
+from setuptools import setup, find_packages
+
+setup(
+    name="somecon",
+    version="0.1.0",
+    description="Example analyses of 'Social media data for conservation science: a methodological overview'",
+    url="https://github.com/DigitalGeographyLab/some-conservationscience",
+    license="CC BY 4.0",
+    packages=find_packages(include=["somecon", "somecon.*"]),
+    python_requires=">=3.6",
+    extras_require={
+        "partitioned": ["dask", "pyarrow>=14"],
+        "flows": ["geopandas", "pandas", "shapely", "fiona", "rtree", "scipy", "numpy", "matplotlib", "basemap"],
+        "densecap": ["numpy", "matplotlib"],
+        "temporal": ["pandas"],
+        "sentiment": ["pandas", "webis"],
+    },
+    entry_points={
+        "console_scripts": ["somecon=somecon.cli:main"],
+    },
+)
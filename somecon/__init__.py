@@ -0,0 +1,23 @@
+"""
+Example analyses of *Social media data for conservation science: a methodological overview*
+(Toivonen et al. 2019, Biological Conservation) as an importable library.
+
+Submodules:
+
+    somecon.flows         Box 1: most probable home country and flows of Kruger visitors
+    somecon.partitioned   Box 1: out-of-core (partitioned) point in polygon and home country pipeline
+    somecon.great_circle  Box 1: Great Circle paths
+    somecon.spatial_tools Box 1: point in polygon and nearest neighbour joins
+    somecon.grid_lookup   Box 1: grid lookup labelling of points (fast point in polygon)
+    somecon.post_history  Box 1: post histories sorted by user and time (binary search lookups)
+    somecon.densecap      Box 2: visualization of DenseCap results
+    somecon.temporal      Box 3: monthly counts of activity-related posts and users
+    somecon.sentiment     Box 4: sentiment of tweets
+    somecon.profiling     Stage-level instrumentation of the pipelines
+    somecon.cli           Command line interface ('somecon' / 'python -m somecon')
+
+Importing the package or its submodules is cheap: geopandas, pandas, matplotlib, Basemap etc. are imported
+only when a function needing them is called.
+"""
+
+__version__ = "0.1.0"
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface of the example analyses:
+
+    somecon flows          Box 1: most probable home country and flows of Kruger visitors
+    somecon densecap-viz   Box 2: visualize DenseCap results
+    somecon temporal       Box 3: monthly counts of activity-related posts and users
+    somecon sentiment      Box 4: sentiment of tweets
+
+The pipelines (and their heavy dependencies) are imported only when the subcommand is run. The same
+functionality is available from Python via main(['flows', ...]) or the functions of the pipeline modules.
+"""
+
+import argparse
+from datetime import datetime
+
+from somecon.profiling import StageProfiler
+
+
+def parseDate(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def runFlowsCommand(args, profiler):
+    if args.partitioned is not None:
+        from somecon.partitioned import runFlowsPartitioned
+        return runFlowsPartitioned(fp=args.posts, user_fp=args.users, knp_fp=args.knp, work_dir=args.partitioned,
+                                   outfp=args.output, c_fp=args.countries, start_date=args.start, end_date=args.end,
+                                   min_posts=args.min_posts, level=args.level, scheduler=args.scheduler,
+                                   num_workers=args.workers, grid_resolution=args.grid_resolution,
+                                   profiler=profiler)
+
+    from somecon.flows import runFlows
+    return runFlows(fp=args.posts, user_fp=args.users, knp_fp=args.knp, outfp=args.output, c_fp=args.countries,
+                    start_date=args.start, end_date=args.end, min_posts=args.min_posts,
+                    grid_resolution=args.grid_resolution, grid_dir=args.grid_dir, profiler=profiler)
+
+
+def runDensecapCommand(args, profiler):
+    from somecon.densecap import drawBoxes
+    return drawBoxes(images=args.images, json_fp=args.json, boxes=args.boxes, output_dir=args.output,
+                     profiler=profiler)
+
+
+def runTemporalCommand(args, profiler):
+    from somecon.temporal import runTemporal
+    return runTemporal(input_fp=args.input, output_fp=args.output, pattern=args.pattern, bbox=args.bbox,
+                       x_column=args.x_column, y_column=args.y_column, profiler=profiler)
+
+
+def runSentimentCommand(args, profiler):
+    from somecon.sentiment import identifySentiment
+    return identifySentiment(input_fp=args.input, output_fp=args.output, profiler=profiler)
+
+
+def buildParser():
+    from somecon import flows, partitioned, temporal
+
+    ap = argparse.ArgumentParser(prog='somecon',
+                                 description="Example analyses of 'Social media data for conservation science: a methodological overview'.")
+    ap.add_argument("--profile", default=None,
+                    help="Write a stage profiling report to this file (.json or .prom). Defaults to $STAGE_PROFILE.")
+    subparsers = ap.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    # Box 1
+    sp = subparsers.add_parser("flows", help="Most probable home country and flows of Kruger visitors.")
+    sp.add_argument("--posts", default="/data/Instagram_Kruger_VisitorHistory_movements_CountryCodes.shp",
+                    help="Post histories of the users.")
+    sp.add_argument("--users", default="/data/Instagram_Kruger_2013-2015_October.shp",
+                    help="Posts from Kruger that were used to collect the users.")
+    sp.add_argument("--knp", default="/data/Kruger_NP_boundaries_2014.shp",
+                    help="Kruger borders.")
+    sp.add_argument("--countries", default="/data/World_countries.shp",
+                    help="Country borders (used if the posts do not have the FIPS_CNTRY column).")
+    sp.add_argument("-o", "--output",
+                    default="/data/Instagram_Global_Kruger_VisitorHistory_trips_to_Kruger_basedOn_probableHomeCountry_GreatCircle.shp",
+                    help="Output file of the flows.")
+    sp.add_argument("--start", type=parseDate, default=flows.START_DATE, help="Start date (YYYY-MM-DD).")
+    sp.add_argument("--end", type=parseDate, default=flows.END_DATE, help="End date (YYYY-MM-DD).")
+    sp.add_argument("--min-posts", type=int, default=flows.MIN_POSTS,
+                    help="Minimum amount of posts to determine the home location.")
+    sp.add_argument("--grid-resolution", type=float, default=None, metavar="DEGREES",
+                    help="Label the posts with a grid lookup of this cell size instead of polygon tests.")
+    sp.add_argument("--grid-dir", default=None,
+                    help="Directory where the lookup grids are saved and reused between runs (not with --partitioned).")
+    sp.add_argument("--partitioned", default=None, metavar="WORK_DIR",
+                    help="Process the posts out of core in spatial partitions written to WORK_DIR.")
+    sp.add_argument("--level", type=int, default=partitioned.PARTITION_LEVEL,
+                    help="Hilbert curve level of the spatial partitions (4**level cells).")
+    sp.add_argument("--scheduler", default="processes", choices=["threads", "processes", "synchronous"],
+                    help="Local dask scheduler of the partitions ('threads' does not parallelise the labelling).")
+    sp.add_argument("--workers", type=int, default=None,
+                    help="Number of workers of the dask scheduler.")
+    sp.set_defaults(func=runFlowsCommand)
+
+    # Box 2
+    sp = subparsers.add_parser("densecap-viz", help="Visualize DenseCap results.")
+    sp.add_argument("-i", "--images", required=True,
+                    help="Path to the directory with images.")
+    sp.add_argument("-j", "--json", required=True,
+                    help="Path to the JSON file containing the results.")
+    sp.add_argument("-b", "--boxes", default=5, type=int,
+                    help="Number of boxes to draw.")
+    sp.add_argument("-o", "--output", default=None,
+                    help="Directory of the output images (default: current directory).")
+    sp.set_defaults(func=runDensecapCommand)
+
+    # Box 3
+    sp = subparsers.add_parser("temporal", help="Monthly counts of activity-related posts and users.")
+    sp.add_argument("-i", "--input", required=True,
+                    help="Posts (CSV with coordinate columns or a spatial file).")
+    sp.add_argument("-o", "--output", default="monthly_activity.csv",
+                    help="Output CSV file.")
+    sp.add_argument("-p", "--pattern", default=temporal.SKIING,
+                    help="Regular expression of the activity in the captions.")
+    sp.add_argument("--bbox", nargs=4, type=float, default=temporal.PALLAS_YLLAS,
+                    metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+                    help="Bounding box of the area (default: Pallas-Yllästunturi National Park).")
+    sp.add_argument("--x-column", default="x", help="Column of the x coordinate in CSV input.")
+    sp.add_argument("--y-column", default="y", help="Column of the y coordinate in CSV input.")
+    sp.set_defaults(func=runTemporalCommand)
+
+    # Box 4
+    sp = subparsers.add_parser("sentiment", help="Sentiment of tweets.")
+    sp.add_argument("-i", "--input", default="sample_data.csv",
+                    help="CSV file with 'tweetId' and 'text' columns.")
+    sp.add_argument("-o", "--output", default="sample_data_with_sentiment.csv",
+                    help="Output CSV file.")
+    sp.set_defaults(func=runSentimentCommand)
+
+    return ap
+
+
+def main(argv=None):
+    """Runs a subcommand. 'argv' defaults to the command line arguments."""
+    parser = buildParser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'partitioned', None) is not None and args.grid_dir is not None:
+        parser.error("--grid-dir cannot be used with --partitioned (the grids of the partitions are not saved)")
+    with StageProfiler.fromEnvironment(pipeline=args.command, output=args.profile) as profiler:
+        result = args.func(args, profiler)
+        profiler.writeReport()
+    return result
@@ -0,0 +1,133 @@
+"""
+Visualization of DenseCap results (Box 2). Draws the bounding boxes and captions of the regions detected
+by DenseCap on the images and saves them as '<image>_boxes.png'.
+
+Formerly the script Box2_content_detection/viz_densecap.py; run with 'somecon densecap-viz' or drawBoxes().
+Numpy and matplotlib are imported only when drawBoxes() is called.
+"""
+
+import json
+import os
+
+from somecon.profiling import StageProfiler
+
+# Define a font dictionary for labels
+FONTDICT = {'family': 'sans-serif',
+            'color': 'white',
+            'weight': 'normal',
+            'size': 8,
+            }
+
+
+def drawBoxes(images, json_fp, boxes=5, output_dir=None, profiler=None):
+    """
+    Draws the 'boxes' first region descriptions of each image in the DenseCap results.
+
+    Parameters:
+    -----------
+
+    images: Path to the directory with images.
+    json_fp: Path to the JSON file containing the results.
+    boxes: Number of boxes to draw.
+    output_dir: Directory of the output images (default: current working directory).
+
+    Returns: a list of the saved files
+    """
+    import numpy as np
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
+    import matplotlib.patches as patches
+
+    if profiler is None:
+        profiler = StageProfiler('densecap-viz', enabled=False)
+
+    # Get a qualitative colourmap from matplotlib
+    colours = matplotlib.cm.Set1.colors
+
+    # Open the file containing DenseCap results
+    with profiler.stage('read_json') as stage, open(json_fp) as res_json:
+
+        # Load data and assign into variable
+        data = json.load(res_json)
+        stage.rows_out = len(data['results'])
+
+    saved = []
+
+    # Loop over the results
+    for i in data['results']:
+
+        # Fetch filename, captions and bounding boxes
+        filename = i['img_name']
+        captions = i['captions'][:boxes]
+        bboxes = i['boxes'][:boxes]
+
+        # Zip captions and boxes; cast into list
+        capboxes = list(zip(captions, bboxes))
+
+        # Load image using matplotlib
+        try:
+            with profiler.stage('read_image') as stage:
+                image = mpimg.imread(os.path.join(images, filename))
+                stage.rows_out = 1
+
+        except FileNotFoundError:
+            continue
+
+        # Draw the region descriptions
+        with profiler.stage('draw_boxes', rows_in=len(capboxes)) as stage:
+
+            # Create a figure
+            fig, ax = plt.subplots(1)
+
+            # Hide grid & axes
+            plt.axis('off')
+            plt.tight_layout(pad=1)
+
+            # Add the image on the axis
+            ax.imshow(image)
+
+            # Loop over the region descriptions
+            for x in range(0, boxes):
+
+                # Round the coordinates
+                coords = [round(x) for x in capboxes[x][1]]
+
+                # Remove negative coordinates
+                coords = [0 if x < 0 else x for x in coords]
+
+                # Assign coordinates to variables
+                startx, starty, width, height = coords[0], coords[1], coords[2], coords[3]
+
+                # Add a rectangle patch
+                rect = patches.Rectangle((startx, starty),
+                                         width, height,
+                                         fill=True,
+                                         alpha=0.2,
+                                         color=colours[x])
+
+                # Put the description text
+                desc = capboxes[x][0]
+
+                # Add the text to the image
+                ax.text(startx + 12, np.random.uniform(starty, starty+height),
+                        desc,
+                        fontdict=FONTDICT,
+                        bbox=dict(facecolor=colours[x],
+                                  alpha=0.4)
+                        )
+
+                # Add the rectangle to the visualization
+                ax.add_patch(rect)
+            stage.rows_out = boxes
+
+        # Save the plot and release the figure (the loop may go over thousands of images)
+        outfp = "{}_boxes.png".format(filename)
+        if output_dir is not None:
+            outfp = os.path.join(output_dir, outfp)
+        with profiler.stage('save_figure', rows_in=1):
+            plt.savefig(outfp, dpi=300)
+            plt.close(fig)
+        saved.append(outfp)
+
+    return saved
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Identifying the most probable home country for Instagram users that have visited Kruger national park, SA.
+The pipeline calculates following things:
+    - Specify country etc. for each post
+    - Calculate the country with 1) most posts and 2) second most posts
+    - Calculate the distance of users movements (Great Circle distance in km)
+    - Calculate the time spent in Kruger national park
+    - Calculate and create a Shapefile where there is the amount of Instagram users in each country
+
+The pipeline was originally the script Box1_visitor_movements/Kruger_flow_map.py. It can be run with
+'somecon flows' or by calling runFlows(). Geopandas, pandas and shapely are imported only when the
+functions are called.
+
+Code associated to following manuscript:
+
+    DGL 2019. "Social media data for conservation science: a methodological overview."
+
+Author:
+    Henrikki Tenkanen, Digital Geography Lab, Department of Geosciences and Geography, University of Helsinki.
+
+Requirements:
+    geopandas
+    pandas
+    shapely
+    matplotlib
+    fiona
+    numpy
+    rtree
+
+License:
+    Creative Commons BY 4.0. See details from https://creativecommons.org/licenses/by/4.0/
+"""
+
+import os
+from datetime import datetime
+
+from somecon.great_circle import greatCircleRoute
+from somecon.post_history import PostHistory
+from somecon.profiling import StageProfiler
+from somecon.spatial_tools import buildRtree, pointInPolygon
+
+# Time window of the posts that are taken into account
+START_DATE, END_DATE = datetime(2010, 1, 1, 0, 0, 0), datetime(2016, 6, 1, 0, 0, 0)
+
+# Minimum amount of posts to determine the home location
+MIN_POSTS = 20
+
+# Columns of the output
+FLOW_COLUMNS = ['userid', 'post_cnt', 'geometry', 'distance', 't_bef_KNP', 'arriv_to_KNP', 't_difference',
+                'Home1_cntr', 'Home1_cnt', 'Home2_cntr', 'Home2_cnt']
+
+
+def pointCoords(point_list):
+    return [(point.x, point.y) for point in point_list]
+
+def createPolyline(point_list):
+    from shapely.geometry import LineString
+    return LineString(pointCoords(point_list))
+
+def calculateTimeDelta(df):
+    df['delta'] = (df['time']-df['time'].shift()).fillna(0)
+    return df
+
+def filterVisits(df, t_threshold):
+    import pandas as pd
+    # Create visit index
+    df['visitidx'] = 0
+    # Column for time windows
+    df['timewindow'] = None
+    # Column for visit time in hours
+    df['visit_h'] = None
+    # Reset index
+    df = df.reset_index()
+    if df['delta'].max() > t_threshold:
+        # Iterate over values and split data into separate DataFrames
+        visit_idx = 1
+        start_idx = 0
+        # Start time
+        start_time = df.loc[0, 'time']
+        # Get the start date of visit
+        start_date = start_time.strftime("%Y/%m/%d")
+        # Iterate over rows
+        for idx, row in df.iterrows():
+            if row['delta'] > t_threshold:
+                # Select visit values
+                df.loc[start_idx:, 'visitidx']=visit_idx
+                # Set start_idx
+                start_idx = idx
+                # Set visit idx
+                visit_idx+=1
+                # End time
+                end_time = df.loc[idx, 'time']
+                # Get end date
+                end_date = end_time.strftime("%Y/%m/%d")
+                # Make time window
+                timewindow = "%s - %s" % (start_date, end_date)
+                # Calculate visit length in hours
+                df['visit_h'] = round((end_time - start_time).seconds/60/60)
+                # Set timewindow
+                df.loc[start_idx:,'timewindow']=timewindow
+                # Reset start_time / date
+                start_date = end_date
+                start_time = end_time
+
+        # Build DateTime index back again
+        df = df.set_index(pd.DatetimeIndex(df['time']))
+        return df
+    else:
+        # Get the start time of visit
+        start_time = df.loc[0, 'time']
+        # Get the start date of visit
+        start_date = start_time.strftime("%Y/%m/%d")
+        # Get end time
+        end_time = df.iloc[-1]['time']
+        # Get end date
+        end_date = end_time.strftime("%Y/%m/%d")
+        # Calculate visit length in hours
+        df['visit_h'] = round((end_time - start_time).seconds/60/60)
+        # Make time window
+        timewindow = "%s - %s" % (start_date, end_date)
+        df['timewindow'] = timewindow
+        return df
+
+
+def labelPosts(point_df, poly_df, poly_rtree, sourceColumn_in_poly, targetColumn_in_point, grid_resolution=None,
+               grid_fp=None):
+    """
+    Point in polygon with spatial_tools.pointInPolygon(), or with a grid lookup (grid_lookup.pointInGrid()) of
+    'grid_resolution' sized cells if given. The grid is saved to / loaded from 'grid_fp' if given.
+    """
+    if grid_resolution is None:
+        return pointInPolygon(point_df=point_df, poly_df=poly_df, poly_rtree=poly_rtree, sourceColumn_in_poly=sourceColumn_in_poly, targetColumn_in_point=targetColumn_in_point)
+
+    from somecon.grid_lookup import buildPolygonGrid, loadOrBuildPolygonGrid, pointInGrid
+    if grid_fp is None:
+        grid = buildPolygonGrid(poly_df, resolution=grid_resolution)
+    else:
+        grid = loadOrBuildPolygonGrid(poly_df, grid_fp, resolution=grid_resolution)
+    return pointInGrid(point_df=point_df, poly_df=poly_df, poly_rtree=poly_rtree, grid=grid, sourceColumn_in_poly=sourceColumn_in_poly, targetColumn_in_point=targetColumn_in_point)
+
+
+def gridFile(grid_dir, poly_fp):
+    """Path of the saved grid of a polygon file, or None if the grids are not saved"""
+    if grid_dir is None:
+        return None
+    os.makedirs(grid_dir, exist_ok=True)
+    return os.path.join(grid_dir, os.path.splitext(os.path.basename(poly_fp))[0] + "_grid.npz")
+
+
+def readKnp(knp_fp, buffer=0.2):
+    """
+    Reads the Kruger borders, projects them to WGS84 and buffers them by 'buffer' decimal degrees
+    (default ~22 km) so that posts taken right next to Kruger are not taken into account as previous location.
+
+    Returns the buffered borders and their spatial index.
+    """
+    import geopandas as gpd
+
+    knp = gpd.read_file(knp_fp)
+
+    # Project to WGS84
+    knp['geometry'] = knp['geometry'].to_crs(epsg=4326)
+
+    # Create a buffer around KNP
+    knp['geometry'] = knp['geometry'].buffer(buffer)
+
+    # Create Spatial Index for the KNP
+    return knp, buildRtree(knp)
+
+
+def selectPosts(some, userids, start_date=START_DATE, end_date=END_DATE):
+    """
+    Creates a datetime index from the 'time_local' timestamps, takes the posts of the time window and
+    selects only users that have for sure been in Kruger (the API returned also some random users from
+    Finland when collecting the data).
+    """
+    import pandas as pd
+
+    # Create datetime index from timestamps (stable sort keeps posts with the same timestamp in the input order)
+    some = some.sort_values(by='time_local', kind='mergesort')
+    some = some.reset_index(drop=True)
+    some['time'] = pd.to_datetime(some['time_local'])
+    some = some.set_index(pd.DatetimeIndex(some['time']))
+
+    # Take a selection
+    some = some[start_date:end_date]
+
+    return some.loc[some['userid'].isin(userids)]
+
+
+def flowFrame(rows):
+    """GeoDataFrame of the flows from rows in the order of FLOW_COLUMNS, with the percentages of the countries"""
+    import geopandas as gpd
+    from fiona.crs import from_epsg
+
+    geo = gpd.GeoDataFrame(rows, columns=FLOW_COLUMNS, geometry='geometry', crs=from_epsg(4326))
+
+    # Calculate the percentage of the 1st ranked country vs the second (to evaluate the accuracy)
+    geo['Home1_cnt%'] = geo['Home1_cnt'] / (geo['Home1_cnt'] + geo['Home2_cnt'])
+    geo['Home2_cnt%'] = geo['Home2_cnt'] / (geo['Home1_cnt'] + geo['Home2_cnt'])
+    return geo
+
+
+def identifyFlows(selected, users, min_posts=MIN_POSTS, identify_country=True, profiler=None):
+    """
+    Determines the most probable home country of each user and creates a Great Circle line from the latest post
+    in the home country (outside Kruger) to the first post in Kruger.
+
+    Parameters:
+    -----------
+
+    selected: Posts of the users with 'FIPS_CNTRY' and 'FromKruger' (null outside Kruger) columns.
+    users: Posts from Kruger that were used to collect the users (for the arrival to Kruger).
+    min_posts: Minimum amount of posts to determine the home location.
+
+    Returns: GeoDataFrame of the flows and the number of users for which no flow could be determined
+    """
+    import numpy as np
+    import pandas as pd
+
+    if profiler is None:
+        profiler = StageProfiler('flows', enabled=False)
+
+    # No posts (e.g. an empty partition), possibly without any columns
+    if len(selected) == 0:
+        return flowFrame([]), 0
+
+    # Rows of the result
+    rows = []
+
+    # Counter for the users who posted their first Instagram post from Kruger
+    kruger_was_first = 0
+
+    # Sort the posts by user and time once; the posts of a user are then a slice of the sorted arrays
+    history = PostHistory(selected)
+    countries = selected['FIPS_CNTRY'].values[history.order]
+    outside_knp = selected['FromKruger'].isnull().values[history.order]
+
+    # The earliest time when arriving to Kruger
+    arrivals = PostHistory(users)
+
+    # Create Polylines between the previous location to Kruger for users within South-Africa
+    for userid in history.users:
+        s = history.userSlice(userid)
+        post_cnt = s.stop - s.start
+        # If there are more points than 1, create a movement pattern
+        if post_cnt > min_posts:
+            # Get the Kruger point from user-data
+            arrival = arrivals.userSlice(userid)
+            if arrival.stop == arrival.start:
+                # No arrival to Kruger for the user
+                kruger_was_first += 1
+                continue
+            first_knp = int(arrivals.order[arrival.start])
+            first_knp_time = users['time_local'].values[first_knp]
+            first_knp_geom = users['geometry'].values[first_knp]
+
+            # The country with most posts
+            user_countries = countries[s]
+            cntry_counts = pd.Series(user_countries).value_counts()
+            most_posts_1, photo_cnt_1 = cntry_counts.index[0], cntry_counts.iloc[0]
+
+            # The country with second most posts
+            try:
+                most_posts_2, photo_cnt_2 = cntry_counts.index[1], cntry_counts.iloc[1]
+            except IndexError:
+                most_posts_2, photo_cnt_2 = "N/A", 0
+
+            # Take posts that are from the most probable home country
+            prev_posts = np.ones(post_cnt, dtype=bool)
+            if identify_country:
+                prev_posts = (user_countries==most_posts_1) & (user_countries!='N/A')
+
+            if not prev_posts.any():
+                kruger_was_first += 1
+                continue
+
+            # Select the latest post that was not from Kruger
+            prev_posts_outside_knp = np.flatnonzero(prev_posts & outside_knp[s])
+            if len(prev_posts_outside_knp) == 0:
+                kruger_was_first += 1
+                continue
+
+            previous = s.start + prev_posts_outside_knp[-1]
+            previous_loc = history.order[previous]
+            previous_geom = selected['geometry'].values[previous_loc]
+            previous_time = selected['time_local'].values[previous_loc]
+
+            # Calculate the time difference (in days) between posts from the epoch seconds
+            time_dif = int((arrivals.times[arrival.start] - history.times[previous]) // 86400)
+
+            # Great Circle Lines (use createPolyline() for direct lines)
+            with profiler.stage('great_circles', rows_in=1):
+                line = greatCircleRoute(ordered_point_list=[previous_geom, first_knp_geom], del_s=100.0)
+
+            # Calculate the distance between posts (in kilometers approximately)
+            distance = line.length * 111.32
+
+            rows.append([userid, post_cnt, line, distance, previous_time, first_knp_time, time_dif,
+                         most_posts_1, photo_cnt_1, most_posts_2, photo_cnt_2])
+        else:
+            kruger_was_first += 1
+
+    return flowFrame(rows), kruger_was_first
+
+
+def runFlows(fp, user_fp, knp_fp, outfp, c_fp=None, start_date=START_DATE, end_date=END_DATE,
+             min_posts=MIN_POSTS, grid_resolution=None, grid_dir=None, profiler=None):
+    """
+    Runs the whole pipeline from the input files to the output Shapefile.
+
+    Parameters:
+    -----------
+
+    fp: Post histories of the users (with 'userid', 'time_local' and 'FIPS_CNTRY').
+    user_fp: Posts from Kruger that were used to collect the users.
+    knp_fp: Kruger borders.
+    outfp: Output file of the flows.
+    c_fp: Country borders. Needed only if the posts do not have the 'FIPS_CNTRY' column yet.
+    grid_resolution: Label the posts with a grid lookup of this cell size (decimal degrees) instead of
+                     testing every post against the polygons. The labels are the same.
+    grid_dir: Directory where the grids are saved and reused between runs.
+
+    Returns: GeoDataFrame of the flows
+    """
+    import geopandas as gpd
+
+    if profiler is None:
+        profiler = StageProfiler('flows', enabled=False)
+
+    # UserID dataset that were used to collect visitor mobilities
+    with profiler.stage('read_users') as stage:
+        users = gpd.read_file(user_fp)
+        userids = users['userid'].unique()
+        stage.rows_out = len(users)
+
+    with profiler.stage('read_knp') as stage:
+        knp, knp_rtree = readKnp(knp_fp)
+        stage.rows_out = len(knp)
+
+    with profiler.stage('read_posts') as stage:
+        some = gpd.read_file(fp)
+        stage.rows_out = len(some)
+
+    # Determine country for each post (if not done already)
+    if 'FIPS_CNTRY' not in some.columns:
+        if c_fp is None:
+            raise Exception("The posts do not have the 'FIPS_CNTRY' column, country borders (c_fp) are needed!")
+        with profiler.stage('read_countries') as stage:
+            world = gpd.read_file(c_fp)
+            rtree = buildRtree(world)
+            stage.rows_out = len(world)
+        with profiler.stage('label_countries', rows_in=len(some)):
+            some = labelPosts(point_df=some, poly_df=world, poly_rtree=rtree, sourceColumn_in_poly='FIPS_CNTRY', targetColumn_in_point='FIPS_CNTRY',
+                              grid_resolution=grid_resolution, grid_fp=gridFile(grid_dir, c_fp))
+
+    with profiler.stage('select_posts', rows_in=len(some)) as stage:
+        selected = selectPosts(some, userids, start_date=start_date, end_date=end_date)
+        stage.rows_out = len(selected)
+
+    # Determine if the post is from Kruger (with 22km buffer) or not
+    with profiler.stage('label_knp', rows_in=len(selected)) as stage:
+        selected = labelPosts(point_df=selected, poly_df=knp, poly_rtree=knp_rtree, sourceColumn_in_poly='NAME', targetColumn_in_point='FromKruger',
+                              grid_resolution=grid_resolution, grid_fp=gridFile(grid_dir, knp_fp))
+        stage.rows_out = int(selected['FromKruger'].notnull().sum())
+
+    with profiler.stage('user_loop', rows_in=len(selected)) as stage:
+        geo, kruger_was_first = identifyFlows(selected, users, min_posts=min_posts, profiler=profiler)
+        stage.rows_out = len(geo)
+
+    with profiler.stage('write_output', rows_in=len(geo)):
+        geo.to_file(outfp)
+
+    return geo
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-Draw_Great_Circle_Paths.py
+great_circle.py (formerly Box1_visitor_movements/Draw_Great_Circle_Paths.py)
 
 Created on Fri Oct  7 10:01:46 2016
 
@@ -60,9 +60,6 @@ An example use-case where we calculate the Great Circle Path between Helsinki an
 @author: Henrikki Tenkanen, Uni. Helsinki.
 """
 
-from shapely.geometry import Point, LineString
-import numpy as np
-
 def parseLatLon(point):
     return point.y, point.x
 
@@ -71,6 +68,7 @@ def coordsToLine(coords_array):
     Takes an array of coordinate pair lists as input (return value of drawgreatcircle() -function) and returns a 
     Shapely LineString.
     """
+    from shapely.geometry import LineString
     
     coordtuple_list = []
     
@@ -130,6 +128,7 @@ def greatCircleRoute(ordered_point_list, del_s=100.0):
     
     Returns: a Shapely.LineString 
     """
+    import numpy as np
     
     # Iterate over points
     for i, point in enumerate(ordered_point_list):
@@ -159,6 +158,7 @@ def greatCircleRoute(ordered_point_list, del_s=100.0):
     
 def main():
     """Example how the tool can be used"""    
+    from shapely.geometry import Point
 
     # nylat, nylon are lat/lon of New York
     nylat = 40.78; nylon = -73.98
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Grid lookup labelling of points as a fast alternative to spatial_tools.pointInPolygon().
+
+The polygons are rasterized once into a regular lat/lon grid: each cell stores the position of the only
+polygon whose interior contains the whole cell, EMPTY if no polygon touches the cell, or AMBIGUOUS if the
+cell is on a polygon boundary (or touched by several polygons). Labelling a point is then a single array
+lookup, and only the points in AMBIGUOUS cells are tested exactly with the R-tree (querySpatialIndex), so the
+labels are the same as with pointInPolygon().
+
+The grid is built by recursively splitting the bounding box of each polygon (a quadtree), so that only the
+cells along the boundaries are tested one by one. It can be saved (.npz) and reused between runs; the
+file stores a fingerprint of the polygons and is rebuilt if they change.
+
+Usage:
+------
+
+    world = gpd.read_file("World_countries.shp")
+    grid = loadOrBuildPolygonGrid(world, "World_countries_grid.npz", resolution=0.1)
+    posts = pointInGrid(point_df=posts, poly_df=world, poly_rtree=buildRtree(world), grid=grid,
+                        sourceColumn_in_poly='FIPS_CNTRY', targetColumn_in_point='FIPS_CNTRY')
+
+Requirements:
+-------------
+    numpy
+    shapely
+    rtree (for the exact tests)
+"""
+
+import hashlib
+import math
+import os
+
+from somecon.spatial_tools import querySpatialIndex
+
+# Cell values other than polygon positions
+EMPTY = -1
+AMBIGUOUS = -2
+
+# Default cell size in decimal degrees (~11 km at the equator)
+RESOLUTION = 0.1
+
+
+class PolygonGrid:
+    """Cell -> polygon position table of a regular grid"""
+
+    def __init__(self, table, bounds, resolution, fingerprint=None, outside=EMPTY):
+        self.table = table
+        self.bounds = tuple(float(b) for b in bounds)
+        self.resolution = resolution
+        self.fingerprint = fingerprint
+        # Value of the points outside the grid (EMPTY if the grid covers all polygons)
+        self.outside = outside
+
+    def lookup(self, x, y):
+        """
+        Returns the polygon position of the cell of each point, EMPTY if no polygon touches the cell and
+        AMBIGUOUS if the point needs an exact test.
+        """
+        import numpy as np
+
+        minx, miny = self.bounds[0], self.bounds[1]
+        nrows, ncols = self.table.shape
+        col = np.floor((np.asarray(x, dtype=float) - minx) / self.resolution)
+        row = np.floor((np.asarray(y, dtype=float) - miny) / self.resolution)
+        inside = (col >= 0) & (col < ncols) & (row >= 0) & (row < nrows)
+
+        ids = np.full(len(col), self.outside, dtype=self.table.dtype)
+        ids[inside] = self.table[row[inside].astype(np.int64), col[inside].astype(np.int64)]
+        return ids
+
+    def ambiguousShare(self):
+        """Share of the cells that need exact tests"""
+        return float((self.table == AMBIGUOUS).mean())
+
+    def save(self, fp):
+        import numpy as np
+        np.savez_compressed(fp, table=self.table, bounds=np.asarray(self.bounds), resolution=self.resolution,
+                            fingerprint=self.fingerprint or "", outside=self.outside)
+
+    @classmethod
+    def load(cls, fp):
+        import numpy as np
+        with np.load(fp) as data:
+            return cls(data['table'], tuple(data['bounds']), float(data['resolution']),
+                       fingerprint=str(data['fingerprint']) or None, outside=int(data['outside']))
+
+
+def polygonFingerprint(poly_df, resolution):
+    """Hash of the polygon geometries (in order) and the cell size"""
+    h = hashlib.sha1(repr(float(resolution)).encode())
+    for geom in poly_df['geometry'].values:
+        h.update(geom.wkb)
+    return h.hexdigest()
+
+
+def fillCells(table, value, r0, r1, c0, c1):
+    """Marks the cells [r0:r1, c0:c1] with 'value'; cells already taken by another polygon become AMBIGUOUS"""
+    cells = table[r0:r1, c0:c1]
+    taken = cells != EMPTY
+    cells[taken] = AMBIGUOUS
+    cells[~taken] = value
+
+
+def rasterizePolygon(table, prepared, pos, bounds, resolution, r0, r1, c0, c1):
+    """Quadtree rasterization of one polygon into the cells [r0:r1, c0:c1]"""
+    from shapely.geometry import box
+
+    # Blocks are enlarged a tiny bit so that points on the cell edges are on the safe side
+    eps = resolution * 1e-6
+    block = box(bounds[0] + c0 * resolution - eps, bounds[1] + r0 * resolution - eps,
+                bounds[0] + c1 * resolution + eps, bounds[1] + r1 * resolution + eps)
+    if not prepared.intersects(block):
+        return
+    if prepared.contains_properly(block):
+        fillCells(table, pos, r0, r1, c0, c1)
+        return
+    if r1 - r0 == 1 and c1 - c0 == 1:
+        fillCells(table, AMBIGUOUS, r0, r1, c0, c1)
+        return
+
+    # Split the longer side into two
+    if r1 - r0 >= c1 - c0:
+        mid = (r0 + r1) // 2
+        rasterizePolygon(table, prepared, pos, bounds, resolution, r0, mid, c0, c1)
+        rasterizePolygon(table, prepared, pos, bounds, resolution, mid, r1, c0, c1)
+    else:
+        mid = (c0 + c1) // 2
+        rasterizePolygon(table, prepared, pos, bounds, resolution, r0, r1, c0, mid)
+        rasterizePolygon(table, prepared, pos, bounds, resolution, r0, r1, mid, c1)
+
+
+def buildPolygonGrid(poly_df, resolution=RESOLUTION, bounds=None):
+    """
+    Rasterizes the polygons of 'poly_df' into a grid of 'resolution' sized cells covering 'bounds'
+    (default: the total bounds of the polygons). Cells store the position of the polygon in 'poly_df'.
+    """
+    import numpy as np
+    from shapely.prepared import prep
+
+    if bounds is None:
+        bounds = poly_df.total_bounds
+    minx, miny, maxx, maxy = bounds
+    ncols = max(1, int(math.ceil((maxx - minx) / resolution)))
+    nrows = max(1, int(math.ceil((maxy - miny) / resolution)))
+    table = np.full((nrows, ncols), EMPTY, dtype=np.int32)
+
+    for pos, geom in enumerate(poly_df['geometry'].values):
+        if geom is None or geom.is_empty:
+            continue
+        # Cells covered by the bounding box of the polygon
+        gminx, gminy, gmaxx, gmaxy = geom.bounds
+        c0 = min(max(int(math.floor((gminx - minx) / resolution)), 0), ncols - 1)
+        c1 = min(max(int(math.floor((gmaxx - minx) / resolution)) + 1, 1), ncols)
+        r0 = min(max(int(math.floor((gminy - miny) / resolution)), 0), nrows - 1)
+        r1 = min(max(int(math.floor((gmaxy - miny) / resolution)) + 1, 1), nrows)
+        rasterizePolygon(table, prep(geom), pos, (minx, miny), resolution, r0, r1, c0, c1)
+
+    # Points outside the grid need exact tests only if the grid does not cover all the polygons
+    pminx, pminy, pmaxx, pmaxy = poly_df.total_bounds
+    covers = minx <= pminx and miny <= pminy and maxx >= pmaxx and maxy >= pmaxy
+    return PolygonGrid(table, (minx, miny, maxx, maxy), resolution,
+                       fingerprint=polygonFingerprint(poly_df, resolution), outside=EMPTY if covers else AMBIGUOUS)
+
+
+def loadOrBuildPolygonGrid(poly_df, fp, resolution=RESOLUTION):
+    """Loads the grid from 'fp' if it was built from the same polygons, otherwise builds and saves it"""
+    fingerprint = polygonFingerprint(poly_df, resolution)
+    if os.path.exists(fp):
+        grid = PolygonGrid.load(fp)
+        if grid.fingerprint == fingerprint:
+            return grid
+
+    grid = buildPolygonGrid(poly_df, resolution=resolution)
+    grid.save(fp)
+    return grid
+
+
+def pointInGrid(point_df, poly_df, poly_rtree, sourceColumn_in_poly, targetColumn_in_point, grid=None,
+                resolution=RESOLUTION):
+    """
+    Same as spatial_tools.pointInPolygon(), but resolves the points with a grid lookup and tests only the
+    points in the boundary cells exactly. The grid is built if it is not given.
+    """
+    import numpy as np
+
+    if grid is None:
+        grid = buildPolygonGrid(poly_df, resolution=resolution)
+
+    data = point_df
+    ids = grid.lookup(data['geometry'].x.values, data['geometry'].y.values)
+
+    labels = np.empty(len(data), dtype=object)
+    labels[:] = None
+    found = ids >= 0
+    labels[found] = poly_df[sourceColumn_in_poly].values[ids[found]]
+
+    # Exact test for the points in boundary cells
+    ambiguous = np.flatnonzero(ids == AMBIGUOUS)
+    if len(ambiguous) > 0:
+        labels[ambiguous] = data.iloc[ambiguous].apply(querySpatialIndex, axis=1, poly_df=poly_df,
+                                                       poly_rtree=poly_rtree, source_column=sourceColumn_in_poly).values
+
+    data[targetColumn_in_point] = labels
+    return data
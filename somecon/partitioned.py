@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Partitioned (out-of-core) execution of the point in polygon labelling and the home country pipeline (Box 1)
+for post histories that do not fit in memory.
+
+The posts are read in chunks and spatially partitioned by their position on a Hilbert curve over the
+WGS84 extent: the first 'level' levels of the curve split the world into 4**level square cells, and nearby
+posts end up in the same partition. Each partition is then processed on its own and loads only the polygons
+overlapping its bounding box. For the home country pipeline, the labelled posts are redistributed into
+buckets by user so that the per-user analysis can run bucket by bucket as well.
+
+The partitions are processed with dask (local scheduler) if it is installed, and one after another otherwise.
+The default 'processes' scheduler runs the partitions in parallel; with 'threads' the point in polygon tests
+and the per-user loop hold the GIL and run about one partition at a time.
+The helper column '_row' (row number in the input file) is used to put the results back into the
+order of the input, so that the results are the same as those of the in-memory functions.
+
+Usage:
+------
+
+    # Label posts with countries, written as one GeoParquet file per partition
+    pointInPolygonPartitioned(fp="posts.shp", polygons="World_countries.shp", sourceColumn_in_poly='FIPS_CNTRY',
+                              targetColumn_in_point='FIPS_CNTRY', work_dir="work/")
+    posts = readPartitioned("work/labelled", helper_columns=False)
+
+    # Home country pipeline (same as somecon.flows.runFlows)
+    geo = runFlowsPartitioned(fp, user_fp, knp_fp, work_dir="work/", outfp="flows.shp")
+
+Requirements:
+-------------
+    geopandas
+    pandas
+    numpy
+    pyarrow (GeoParquet)
+    dask (optional)
+"""
+
+import glob
+import os
+import shutil
+
+from somecon.profiling import StageProfiler
+from somecon.spatial_tools import buildRtree, pointInPolygon
+
+# Extent of the Hilbert curve (WGS84)
+WORLD_BOUNDS = (-180.0, -90.0, 180.0, 90.0)
+
+# Number of Hilbert curve levels used for the spatial partitions (4**3 = 64 cells)
+PARTITION_LEVEL = 3
+
+# Number of rows read from the input file at a time
+CHUNK_SIZE = 500000
+
+
+def hilbertIndex(x, y, order=16, bounds=WORLD_BOUNDS):
+    """
+    Calculates the distance along a Hilbert curve of 'order' levels for arrays of x and y coordinates
+    inside 'bounds' (xmin, ymin, xmax, ymax).
+    """
+    import numpy as np
+
+    n = 1 << order
+    xmin, ymin, xmax, ymax = bounds
+    xi = np.clip(((np.asarray(x, dtype=float) - xmin) / (xmax - xmin) * n).astype(np.int64), 0, n - 1)
+    yi = np.clip(((np.asarray(y, dtype=float) - ymin) / (ymax - ymin) * n).astype(np.int64), 0, n - 1)
+    d = np.zeros(len(xi), dtype=np.int64)
+
+    s = n >> 1
+    while s > 0:
+        rx = ((xi & s) > 0).astype(np.int64)
+        ry = ((yi & s) > 0).astype(np.int64)
+        d += s * s * ((3 * rx) ^ ry)
+
+        # Rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        xi = np.where(flip, n - 1 - xi, xi)
+        yi = np.where(flip, n - 1 - yi, yi)
+        swap = ry == 0
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+        s >>= 1
+    return d
+
+
+def spatialPartition(points, level=PARTITION_LEVEL, order=16):
+    """Returns the Hilbert cell (partition key) of each point at 'level'"""
+    d = hilbertIndex(points['geometry'].x.values, points['geometry'].y.values, order=order)
+    return d >> (2 * (order - level))
+
+
+def userBucket(userids, buckets):
+    """Returns the bucket of each user (stable across processes, unlike hash())"""
+    import pandas as pd
+    return (pd.util.hash_pandas_object(userids, index=False) % buckets).values
+
+
+def readChunks(fp, chunk_size=CHUNK_SIZE):
+    """Reads a spatial file 'chunk_size' rows at a time and adds the row number in the file as column '_row'"""
+    import geopandas as gpd
+
+    start = 0
+    while True:
+        chunk = gpd.read_file(fp, rows=slice(start, start + chunk_size))
+        if len(chunk) == 0:
+            break
+        chunk['_row'] = range(start, start + len(chunk))
+        yield chunk
+        start += len(chunk)
+
+
+def partitionPoints(fp, out_dir, level=PARTITION_LEVEL, chunk_size=CHUNK_SIZE, profiler=None):
+    """
+    Splits the points of 'fp' into spatial partitions without loading the whole file. The partitions are
+    written as '<out_dir>/part-<key>/chunk-<n>.parquet'.
+
+    Returns: a sorted list of the partition directories
+    """
+    if profiler is None:
+        profiler = StageProfiler('partitioned', enabled=False)
+
+    for n, chunk in enumerate(readChunks(fp, chunk_size=chunk_size)):
+        with profiler.stage('partition_points', rows_in=len(chunk)):
+            chunk['_part'] = spatialPartition(chunk, level=level)
+            for key, part in chunk.groupby('_part'):
+                part_dir = os.path.join(out_dir, "part-%05d" % key)
+                os.makedirs(part_dir, exist_ok=True)
+                part.to_parquet(os.path.join(part_dir, "chunk-%05d.parquet" % n))
+
+    return sorted(glob.glob(os.path.join(out_dir, "part-*")))
+
+
+def readPartitioned(path, helper_columns=True):
+    """
+    Reads the GeoParquet files of a partition directory (or of all partitions under it) and restores the
+    order and index of the rows in the input file. The helper columns of the partitioning ('_row', '_part',
+    '_bucket') are dropped if 'helper_columns' is False.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    files = sorted(glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True))
+    if len(files) == 0:
+        raise Exception("No partitions found in " + path + "!")
+    data = pd.concat([gpd.read_parquet(f) for f in files])
+    data = data.sort_values(by='_row', kind='mergesort')
+    data = data.set_index('_row', drop=False)
+    data.index.name = None
+    if not helper_columns:
+        data = data.drop(columns=[c for c in ['_row', '_part', '_bucket'] if c in data.columns])
+    return data
+
+
+def selectPolygons(polygons, bounds):
+    """
+    Selects the polygons overlapping 'bounds'. 'polygons' can be a GeoDataFrame or a file, in which case only
+    the overlapping polygons are read. The index is reset so that it can be used with buildRtree().
+    """
+    import geopandas as gpd
+
+    if isinstance(polygons, str):
+        subset = gpd.read_file(polygons, bbox=tuple(bounds))
+    else:
+        minx, miny, maxx, maxy = bounds
+        subset = polygons.cx[minx:maxx, miny:maxy]
+    return subset.reset_index(drop=True)
+
+
+def labelPoints(points, polygons, sourceColumn_in_poly, targetColumn_in_point, grid_resolution=None):
+    """
+    Point in polygon for one partition using only the polygons overlapping the partition. With
+    'grid_resolution', the points are labelled with a grid lookup of the partition's polygons
+    (see grid_lookup.pointInGrid()).
+    """
+    poly_df = selectPolygons(polygons, points.total_bounds)
+    if len(poly_df) == 0:
+        points[targetColumn_in_point] = None
+        return points
+    if grid_resolution is None:
+        return pointInPolygon(point_df=points, poly_df=poly_df, poly_rtree=buildRtree(poly_df),
+                              sourceColumn_in_poly=sourceColumn_in_poly, targetColumn_in_point=targetColumn_in_point)
+
+    from somecon.grid_lookup import pointInGrid
+    return pointInGrid(point_df=points, poly_df=poly_df, poly_rtree=buildRtree(poly_df), resolution=grid_resolution,
+                       sourceColumn_in_poly=sourceColumn_in_poly, targetColumn_in_point=targetColumn_in_point)
+
+
+def labelPartition(part_dir, out_dir, polygons, sourceColumn_in_poly, targetColumn_in_point, grid_resolution=None):
+    """Labels the points of one partition and writes them to '<out_dir>/<partition>.parquet'"""
+    points = readPartitioned(part_dir)
+    points = labelPoints(points, polygons, sourceColumn_in_poly, targetColumn_in_point,
+                         grid_resolution=grid_resolution)
+    os.makedirs(out_dir, exist_ok=True)
+    points.to_parquet(os.path.join(out_dir, os.path.basename(part_dir) + ".parquet"))
+    return len(points)
+
+
+def clearWorkDir(work_dir, subdirs):
+    """Removes the output of a previous run from the subdirectories of 'work_dir'"""
+    for subdir in subdirs:
+        shutil.rmtree(os.path.join(work_dir, subdir), ignore_errors=True)
+
+
+def computePartitions(func, tasks, scheduler='processes', num_workers=None):
+    """
+    Runs func(*task) for each task with the local dask scheduler ('threads', 'processes' or 'synchronous').
+    Falls back to running the tasks one after another if dask is not installed.
+    """
+    try:
+        import dask
+    except ImportError:
+        return [func(*task) for task in tasks]
+
+    delayed = [dask.delayed(func)(*task) for task in tasks]
+    return list(dask.compute(*delayed, scheduler=scheduler, num_workers=num_workers))
+
+
+def pointInPolygonPartitioned(fp, polygons, sourceColumn_in_poly, targetColumn_in_point, work_dir,
+                              level=PARTITION_LEVEL, chunk_size=CHUNK_SIZE, scheduler='processes', num_workers=None,
+                              grid_resolution=None, profiler=None):
+    """
+    Partitioned version of spatial_tools.pointInPolygon() for point files larger than memory.
+
+    Parameters:
+    -----------
+
+    fp: Point file.
+    polygons: Polygon file (or GeoDataFrame) in the same coordinate system.
+    work_dir: Directory for the partitions. The labelled points are written to '<work_dir>/labelled'. The
+              output of a previous run in '<work_dir>/points' and '<work_dir>/labelled' is removed.
+    grid_resolution: Label the points with a grid lookup of this cell size (see grid_lookup.pointInGrid()).
+
+    Returns: the directory of the labelled partitions (read them with readPartitioned())
+    """
+    if profiler is None:
+        profiler = StageProfiler('partitioned', enabled=False)
+
+    clearWorkDir(work_dir, ["points", "labelled"])
+    part_dirs = partitionPoints(fp, os.path.join(work_dir, "points"), level=level, chunk_size=chunk_size,
+                                profiler=profiler)
+
+    out_dir = os.path.join(work_dir, "labelled")
+    tasks = [(part_dir, out_dir, polygons, sourceColumn_in_poly, targetColumn_in_point, grid_resolution)
+             for part_dir in part_dirs]
+    with profiler.stage('label_partitions') as stage:
+        stage.rows_out = sum(computePartitions(labelPartition, tasks, scheduler=scheduler, num_workers=num_workers))
+    return out_dir
+
+
+def prepareFlowPartition(part_dir, out_dir, user_buckets, knp, c_fp=None, start_date=None, end_date=None,
+                         grid_resolution=None):
+    """
+    Selects the posts of one spatial partition that belong to the time window and the users, labels them
+    (country if needed, Kruger), assigns them to user buckets ('_bucket') and writes them to
+    '<out_dir>/<partition>.parquet'. 'user_buckets' is a Series of the buckets indexed by the userids.
+    """
+    import pandas as pd
+
+    posts = readPartitioned(part_dir)
+
+    # Same selection as flows.selectPosts()
+    time = pd.to_datetime(posts['time_local'])
+    posts = posts.loc[(time >= start_date) & (time <= end_date) & posts['userid'].isin(user_buckets.index)].copy()
+    if len(posts) == 0:
+        return 0
+
+    if 'FIPS_CNTRY' not in posts.columns:
+        posts = labelPoints(posts, c_fp, 'FIPS_CNTRY', 'FIPS_CNTRY', grid_resolution=grid_resolution)
+    posts = labelPoints(posts, knp, 'NAME', 'FromKruger', grid_resolution=grid_resolution)
+
+    # The bucket of the matching user (hashing the userids of the posts could differ if their dtype differs)
+    posts['_bucket'] = posts['userid'].map(user_buckets).values.astype('int64')
+    os.makedirs(out_dir, exist_ok=True)
+    posts.to_parquet(os.path.join(out_dir, os.path.basename(part_dir) + ".parquet"))
+    return len(posts)
+
+
+def bucketPosts(in_dir, out_dir):
+    """
+    Redistributes the labelled posts of all partitions in 'in_dir' into the user buckets
+    '<out_dir>/_bucket=<bucket>/' in one streaming pass, so that each bucket is read from its own directory.
+
+    Returns: dictionary of bucket -> bucket directory
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    files = sorted(glob.glob(os.path.join(in_dir, "*.parquet")))
+    if len(files) == 0:
+        return {}
+
+    # Columns without any values in a partition (e.g. 'FromKruger') are stored with the null type
+    schema = pa.unify_schemas([pq.read_schema(f) for f in files], promote_options='permissive')
+    ds.write_dataset(ds.dataset(files, schema=schema, format='parquet'), out_dir, format='parquet',
+                     partitioning=['_bucket'], partitioning_flavor='hive')
+    return {int(os.path.basename(d).split('=')[1]): d for d in glob.glob(os.path.join(out_dir, "_bucket=*"))}
+
+
+def flowsOfBucket(bucket_dir, out_fp, users, start_date, end_date, min_posts):
+    """Runs the per-user analysis of flows.identifyFlows() for one bucket ('users' of the bucket only)"""
+    from somecon.flows import identifyFlows, selectPosts
+
+    # Rows are in the order of the input, so that posts with the same timestamp are sorted as in memory
+    posts = readPartitioned(bucket_dir)
+    selected = selectPosts(posts, posts['userid'].unique(), start_date=start_date, end_date=end_date)
+    geo, kruger_was_first = identifyFlows(selected, users, min_posts=min_posts)
+    geo.to_parquet(out_fp)
+    return kruger_was_first
+
+
+def runFlowsPartitioned(fp, user_fp, knp_fp, work_dir, outfp=None, c_fp=None, start_date=None, end_date=None,
+                        min_posts=None, level=PARTITION_LEVEL, buckets=64, chunk_size=CHUNK_SIZE,
+                        scheduler='processes', num_workers=None, grid_resolution=None, profiler=None):
+    """
+    Partitioned version of flows.runFlows() that processes the post histories ('fp') out of core.
+
+    The flows of each user bucket are written to '<work_dir>/flows/user-<bucket>.parquet'. If 'outfp' is
+    given, all flows are also written into one file. The output of a previous run in the subdirectories
+    of 'work_dir' is removed at the start. With 'grid_resolution', the posts are labelled with grid lookups
+    built for each partition (the grids are not saved).
+
+    Returns: GeoDataFrame of the flows (the same as returned by flows.runFlows())
+    """
+    import geopandas as gpd
+    import pandas as pd
+    from somecon import flows
+
+    if start_date is None:
+        start_date = flows.START_DATE
+    if end_date is None:
+        end_date = flows.END_DATE
+    if min_posts is None:
+        min_posts = flows.MIN_POSTS
+    if profiler is None:
+        profiler = StageProfiler('flows', enabled=False)
+
+    # Fail before the posts are partitioned if the countries cannot be determined
+    if c_fp is None and 'FIPS_CNTRY' not in gpd.read_file(fp, rows=1).columns:
+        raise Exception("The posts do not have the 'FIPS_CNTRY' column, country borders (c_fp) are needed!")
+
+    clearWorkDir(work_dir, ["posts", "labelled", "users", "flows"])
+
+    with profiler.stage('read_users') as stage:
+        users = gpd.read_file(user_fp)
+        stage.rows_out = len(users)
+
+    # Bucket of each user, used for both the arrivals and the posts
+    user_buckets = userBucket(users['userid'], buckets)
+    bucket_of_user = pd.Series(user_buckets, index=users['userid'].values)
+    bucket_of_user = bucket_of_user[~bucket_of_user.index.duplicated()]
+
+    with profiler.stage('read_knp') as stage:
+        knp, _ = flows.readKnp(knp_fp)
+        stage.rows_out = len(knp)
+
+    part_dirs = partitionPoints(fp, os.path.join(work_dir, "posts"), level=level, chunk_size=chunk_size,
+                                profiler=profiler)
+
+    labelled_dir = os.path.join(work_dir, "labelled")
+    tasks = [(part_dir, labelled_dir, bucket_of_user, knp, c_fp, start_date, end_date, grid_resolution)
+             for part_dir in part_dirs]
+    with profiler.stage('label_partitions') as stage:
+        stage.rows_out = sum(computePartitions(prepareFlowPartition, tasks, scheduler=scheduler,
+                                               num_workers=num_workers))
+
+    with profiler.stage('bucket_posts', rows_in=stage.rows_out):
+        bucket_dirs = bucketPosts(labelled_dir, os.path.join(work_dir, "users"))
+
+    # Each bucket gets only the arrivals of its own users
+    flows_dir = os.path.join(work_dir, "flows")
+    os.makedirs(flows_dir, exist_ok=True)
+    tasks = [(bucket_dirs[bucket], os.path.join(flows_dir, "user-%05d.parquet" % bucket),
+              users.loc[user_buckets == bucket], start_date, end_date, min_posts) for bucket in sorted(bucket_dirs)]
+    with profiler.stage('user_loop'):
+        computePartitions(flowsOfBucket, tasks, scheduler=scheduler, num_workers=num_workers)
+
+    # Combine the flows in the order of the users (as in groupby('userid'))
+    with profiler.stage('combine_flows') as stage:
+        parts = [gpd.read_parquet(f) for f in sorted(glob.glob(os.path.join(flows_dir, "*.parquet")))]
+        if len(parts) == 0:
+            geo = flows.flowFrame([])
+        else:
+            geo = pd.concat(parts).sort_values(by='userid', kind='mergesort').reset_index(drop=True)
+        stage.rows_out = len(geo)
+
+    if outfp is not None:
+        with profiler.stage('write_output', rows_in=len(geo)):
+            geo.to_file(outfp)
+
+    return geo
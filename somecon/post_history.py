@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Post histories sorted by (user, time) for fast per-user and time window lookups.
+
+The timestamps are parsed once into int64 epoch seconds and the posts are sorted by user and time. The posts
+of a user are then a contiguous range of the sorted arrays, found with a binary search, and time windows
+within it are found with another binary search. Lookups return slices of the sorted arrays (views, no copies)
+or positions of the rows in the original DataFrame.
+
+The home country pipeline (flows.identifyFlows()) uses userSlice(). The other lookups (first(), window(),
+firstAtOrAfter() and lastBefore()) are not used by the pipeline yet.
+
+Usage:
+------
+
+    history = PostHistory(posts, time_column='time_local')
+    s = history.userSlice('12345')              # all posts of the user
+    times = history.times[s]                    # epoch seconds of the posts (a view)
+    rows = posts.iloc[history.order[s]]         # the posts as a DataFrame
+    first = history.first('12345')              # row position of the first post
+    before = history.lastBefore('12345', t)     # row position of the last post before epoch second t
+
+Requirements:
+-------------
+    numpy
+    pandas
+"""
+
+
+def epochSeconds(values):
+    """Converts timestamps (strings or datetimes) into int64 seconds since 1970-01-01"""
+    import numpy as np
+    import pandas as pd
+
+    times = pd.to_datetime(pd.Series(values))
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(None)
+    times = times.values.astype('datetime64[ns]')
+    return (times - np.datetime64(0, 's')) // np.timedelta64(1, 's')
+
+
+class PostHistory:
+    """
+    Posts sorted by (user, time).
+
+    Attributes:
+    -----------
+
+    users: Sorted array of the unique users.
+    order: Row positions of the posts in the original DataFrame in (user, time) order.
+    times: Epoch seconds of the posts in (user, time) order.
+    starts, ends: Range of the posts of each user (in the order of 'users') in the sorted arrays.
+    """
+
+    def __init__(self, posts, user_column='userid', time_column='time_local'):
+        import numpy as np
+        import pandas as pd
+
+        # Users as sorted codes (posts without a user are left out, as in groupby())
+        codes, self.users = pd.factorize(posts[user_column], sort=True)
+        self.users = np.asarray(self.users)
+        times = epochSeconds(posts[time_column])
+
+        # Stable sort: posts with the same timestamp stay in the order of the DataFrame
+        order = np.lexsort((times, codes))
+        order = order[codes[order] >= 0]
+        self.order = order
+        self.times = times[order]
+
+        sorted_codes = codes[order]
+        user_codes = np.arange(len(self.users))
+        self.starts = np.searchsorted(sorted_codes, user_codes, side='left')
+        self.ends = np.searchsorted(sorted_codes, user_codes, side='right')
+
+    def __len__(self):
+        return len(self.order)
+
+    def userIndex(self, userid):
+        """Position of the user in 'users', or None if the user has no posts"""
+        import numpy as np
+
+        i = int(np.searchsorted(self.users, userid))
+        if i < len(self.users) and self.users[i] == userid:
+            return i
+        return None
+
+    def userSlice(self, userid):
+        """Slice of the sorted arrays with the posts of the user (empty if the user has no posts)"""
+        i = self.userIndex(userid)
+        if i is None:
+            return slice(0, 0)
+        return slice(int(self.starts[i]), int(self.ends[i]))
+
+    def window(self, userid, start=None, end=None):
+        """Slice of the sorted arrays with the posts of the user with start <= time <= end (epoch seconds)"""
+        import numpy as np
+
+        s = self.userSlice(userid)
+        times = self.times[s]
+        lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side='right'))
+        return slice(s.start + lo, s.start + max(lo, hi))
+
+    def first(self, userid):
+        """Row position of the first post of the user, or None"""
+        s = self.userSlice(userid)
+        if s.stop == s.start:
+            return None
+        return int(self.order[s.start])
+
+    def firstAtOrAfter(self, userid, t):
+        """Row position of the first post of the user at or after epoch second t, or None"""
+        s = self.window(userid, start=t)
+        if s.stop == s.start:
+            return None
+        return int(self.order[s.start])
+
+    def lastBefore(self, userid, t):
+        """Row position of the last post of the user before epoch second t, or None"""
+        s = self.window(userid, end=t - 1)
+        if s.stop == s.start:
+            return None
+        return int(self.order[s.stop - 1])
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+profiling.py
+
+Description:
+------------
+Lightweight instrumentation for the stages of the example pipelines (Box 1 home country / flow map,
+Box 2 DenseCap visualization and Box 4 sentiment detection).
+
+Every stage records its wall time, the number of rows going in and out, the throughput (rows/sec) and
+the memory high-water mark of the process when the stage finished. Optionally, the Python heap peak of each
+stage (tracemalloc) and a sampling profile of the running code can be collected as well. The results can be
+written as a JSON document or in the Prometheus text exposition format.
+
+Instrumentation is switched off unless the environment variable STAGE_PROFILE points to an output file,
+in which case disabled stages cost only a few function calls.
+
+Environment variables:
+----------------------
+
+  STAGE_PROFILE: Output file of the report. Files ending with .prom or .txt are written in the Prometheus
+                 text format, all others as JSON.
+  STAGE_PROFILE_SAMPLE_INTERVAL: Interval (in seconds) of the sampling profiler, e.g. 0.01. Not sampled if unset.
+  STAGE_PROFILE_TRACEMALLOC: Set to 1 to record the Python heap peak of each stage (slows down the run considerably).
+
+Usage:
+------
+
+    profiler = StageProfiler.fromEnvironment(pipeline='flows')
+
+    with profiler.stage('read_posts') as stage:
+        posts = gpd.read_file(fp)
+        stage.rows_out = len(posts)
+
+    with profiler.stage('label_knp', rows_in=len(posts)) as stage:
+        posts = pointInPolygon(...)
+        stage.rows_out = len(posts)
+
+    profiler.writeReport()
+    profiler.close()
+
+The profiler can also be used as a context manager, which closes it at the end of the with-block. Closing
+stops the sampling thread and the tracemalloc tracing if the profiler started them.
+
+Stages with the same name (e.g. a stage entered once per user inside a loop) are aggregated into a single
+record with a call count.
+
+Sampling profiler hook:
+-----------------------
+
+Any object with start() and stop() methods (and optionally summary() returning a dict) can be passed as
+'sampler', e.g. a pyinstrument.Profiler. The built-in StackSampler collects the stacks of the profiled thread
+in collapsed format (compatible with flamegraph.pl) and attributes them to the stage that was running.
+
+@author: Digital Geography Lab, University of Helsinki.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def maxRssBytes():
+    """Returns the memory high-water mark (max resident set size) of the process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS but in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+class StageRecord:
+    """Measurements of a single (possibly repeatedly entered) pipeline stage"""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.max_rss_bytes = None
+        self.heap_peak_bytes = None
+
+    def merge(self, other):
+        """Adds the measurements of another call of the same stage"""
+        self.calls += other.calls
+        self.wall_seconds += other.wall_seconds
+        self.rows_in = addRows(self.rows_in, other.rows_in)
+        self.rows_out = addRows(self.rows_out, other.rows_out)
+        self.max_rss_bytes = maxOf(self.max_rss_bytes, other.max_rss_bytes)
+        self.heap_peak_bytes = maxOf(self.heap_peak_bytes, other.heap_peak_bytes)
+
+    def rowsPerSecond(self):
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if rows is None or self.wall_seconds <= 0:
+            return None
+        return rows / self.wall_seconds
+
+    def asDict(self):
+        return {'stage': self.name,
+                'calls': self.calls,
+                'wall_seconds': self.wall_seconds,
+                'rows_in': self.rows_in,
+                'rows_out': self.rows_out,
+                'rows_per_sec': self.rowsPerSecond(),
+                'max_rss_bytes': self.max_rss_bytes,
+                'heap_peak_bytes': self.heap_peak_bytes,
+                }
+
+
+def addRows(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def maxOf(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+class StackSampler:
+    """
+    Minimal sampling profiler. A background thread takes a snapshot of the stack of the profiled thread
+    every 'interval' seconds and counts the collapsed stacks per running stage.
+    """
+
+    def __init__(self, interval=0.01, thread_id=None, label=None, max_depth=64):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        # Callable returning the name of the stage that is currently running
+        self.label = label
+        self.max_depth = max_depth
+        self.samples = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='StackSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            label = self.label() if self.label is not None else None
+            counts = self.samples.setdefault(label or 'unstaged', Counter())
+            counts[';'.join(reversed(stack))] += 1
+
+    def summary(self, top=20):
+        """Returns the most frequent collapsed stacks of each stage"""
+        return {'interval_seconds': self.interval,
+                'stacks': {stage: [{'stack': stack, 'samples': n} for stack, n in counts.most_common(top)]
+                           for stage, counts in self.samples.items()},
+                }
+
+
+class StageProfiler:
+    """Collects StageRecords of a pipeline and writes them as a JSON or Prometheus text report"""
+
+    def __init__(self, pipeline, enabled=True, output=None, sampler=None, sample_interval=None, trace_memory=False):
+        self.pipeline = pipeline
+        self.enabled = enabled
+        self.output = output
+        self.trace_memory = trace_memory
+        self.records = {}
+        self._stack = []
+        self._heap_peaks = []
+        if sampler is None and sample_interval:
+            sampler = StackSampler(interval=sample_interval, label=self.currentStage)
+        self.sampler = sampler
+        self._sampler_running = False
+        self._started_tracemalloc = False
+
+    @classmethod
+    def fromEnvironment(cls, pipeline, output=None):
+        """Creates a profiler that is enabled only if 'output' or the STAGE_PROFILE environment variable is set"""
+        output = output or os.environ.get('STAGE_PROFILE')
+        interval = os.environ.get('STAGE_PROFILE_SAMPLE_INTERVAL')
+        return cls(pipeline,
+                   enabled=bool(output),
+                   output=output,
+                   sample_interval=float(interval) if interval else None,
+                   trace_memory=os.environ.get('STAGE_PROFILE_TRACEMALLOC') == '1')
+
+    def currentStage(self):
+        return self._stack[-1] if self._stack else None
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Measures the code in the with-block. Set 'rows_out' of the yielded record to record the output size."""
+        record = StageRecord(name, rows_in=rows_in)
+        if not self.enabled:
+            yield record
+            return
+
+        if self.sampler is not None and not self._sampler_running:
+            self.sampler.start()
+            self._sampler_running = True
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            # Keep the peak of the enclosing stage before the nested stage resets it
+            self._pushHeapPeak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._heap_peaks.append(0)
+
+        # Register the stage on entry so that the report lists the stages in the order they were started
+        self.records.setdefault(name, None)
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - start
+            record.calls = 1
+            record.max_rss_bytes = maxRssBytes()
+            if self.trace_memory:
+                record.heap_peak_bytes = max(self._heap_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                self._pushHeapPeak(record.heap_peak_bytes)
+            self._stack.pop()
+            if self.records[name] is None:
+                self.records[name] = record
+            else:
+                self.records[name].merge(record)
+
+    def _pushHeapPeak(self, peak):
+        """Updates the heap peak of the innermost running stage"""
+        if self._heap_peaks:
+            self._heap_peaks[-1] = max(self._heap_peaks[-1], peak)
+
+    def stopSampler(self):
+        if self._sampler_running:
+            self.sampler.stop()
+            self._sampler_running = False
+
+    def close(self):
+        """Stops the sampling thread and the tracemalloc tracing started by the profiler. The records are kept."""
+        self.stopSampler()
+        if self._started_tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def report(self):
+        """Returns the measurements as a dictionary"""
+        self.stopSampler()
+        report = {'pipeline': self.pipeline,
+                  'max_rss_bytes': maxRssBytes(),
+                  'stages': [record.asDict() for record in self.records.values() if record is not None],
+                  }
+        if self.sampler is not None and hasattr(self.sampler, 'summary'):
+            report['profile'] = self.sampler.summary()
+        return report
+
+    def toJSON(self):
+        return json.dumps(self.report(), indent=2)
+
+    def toPrometheus(self):
+        """Returns the measurements in the Prometheus text exposition format"""
+        metrics = [('wall_seconds', 'Wall time spent in the stage.', 'wall_seconds'),
+                   ('calls', 'Number of times the stage was entered.', 'calls'),
+                   ('rows_in', 'Rows going into the stage.', 'rows_in'),
+                   ('rows_out', 'Rows coming out of the stage.', 'rows_out'),
+                   ('rows_per_second', 'Throughput of the stage.', 'rows_per_sec'),
+                   ('max_rss_bytes', 'Memory high-water mark of the process after the stage.', 'max_rss_bytes'),
+                   ('heap_peak_bytes', 'Peak of the Python heap during the stage.', 'heap_peak_bytes'),
+                   ]
+        stages = self.report()['stages']
+        lines = []
+        for metric, description, key in metrics:
+            values = [(s['stage'], s[key]) for s in stages if s[key] is not None]
+            if len(values) == 0:
+                continue
+            name = "pipeline_stage_%s" % metric
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s gauge" % name)
+            for stage, value in values:
+                lines.append('%s{pipeline="%s",stage="%s"} %s' % (name, self.pipeline, stage, repr(float(value))))
+        return "\n".join(lines) + "\n"
+
+    def writeReport(self, path=None):
+        """Writes the report to 'path' (default: the STAGE_PROFILE file). Does nothing if profiling is disabled."""
+        path = path or self.output
+        if not self.enabled or not path:
+            return None
+        if path.endswith('.prom') or path.endswith('.txt'):
+            text = self.toPrometheus()
+        else:
+            text = self.toJSON()
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
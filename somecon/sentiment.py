@@ -0,0 +1,45 @@
+"""
+Sentiment detection of tweets (Box 4) with the Webis ensemble (via the python-webis wrapper).
+
+Formerly the script Box4_sentiment/identify_sentiment.py; run with 'somecon sentiment' or
+identifySentiment(). Pandas and webis are imported only when identifySentiment() is called.
+"""
+
+from somecon.profiling import StageProfiler
+
+
+def identifySentiment(input_fp="sample_data.csv",
+                      output_fp="sample_data_with_sentiment.csv",
+                      profiler=None):
+    """
+    Identifies the sentiment of the tweets in 'input_fp' (columns 'tweetId'
+    and 'text') and writes them together with the sentiment to 'output_fp'.
+
+    Returns: the tweets as a pandas.DataFrame indexed by 'tweetId'
+    """
+    import pandas
+    import webis
+
+    if profiler is None:
+        profiler = StageProfiler("sentiment", enabled=False)
+
+    with profiler.stage("read_csv") as stage:
+        tweets = pandas.read_csv(input_fp)
+        stage.rows_out = len(tweets)
+
+    with profiler.stage("identify_sentiment", rows_in=len(tweets)) as stage:
+        sentiment = webis.SentimentIdentifier().identifySentiment(
+            tweets[["tweetId", "text"]]
+        )
+        stage.rows_out = len(sentiment)
+
+    with profiler.stage("join", rows_in=len(tweets)) as stage:
+        tweets.set_index("tweetId", inplace=True)
+        sentiment.set_index("tweetId", inplace=True)
+        tweets = tweets.join(sentiment)
+        stage.rows_out = len(tweets)
+
+    with profiler.stage("write_csv", rows_in=len(tweets)):
+        tweets.to_csv(output_fp)
+
+    return tweets
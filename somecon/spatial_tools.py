@@ -1,11 +1,15 @@
-import numpy as np
-from scipy.spatial import cKDTree
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point, Polygon
-from rtree import index
+# -*- coding: utf-8 -*-
+"""
+Helper functions for spatial queries (point in polygon, nearest neighbour join) with GeoDataFrames.
+
+The heavy dependencies (numpy, scipy, pandas, geopandas, rtree) are imported only when the function
+needing them is called, so that importing this module is cheap.
+"""
+
+import os
 
 def buildRtree(polygon_df):
+    from rtree import index
     idx = index.Index()
     for poly in polygon_df.iterrows():
         idx.insert(poly[0], poly[1]['geometry'].bounds)
@@ -37,6 +41,7 @@ def parseShapefilePaths(topFolder):
 
 def createCoordTuples(data):
     """Extracts coordinate tuples from Shapely Points objects"""
+    import numpy as np
     data['xy'] = None
     for i, row in data.iterrows():
         data['xy'][i] = [np.round(row['geometry'].x, decimals=5), np.round(row['geometry'].y, decimals=5)]
@@ -44,6 +49,7 @@ def createCoordTuples(data):
 
 def createCoordStrings(data):
     """Extracts coordinate strings from Shapely Points objects"""
+    import numpy as np
     data['x'] = None
     data['y'] = None
     for i, row in data.iterrows():
@@ -52,6 +58,8 @@ def createCoordStrings(data):
 
 
 def findNN(from_coords, to_coords):
+    from scipy.spatial import cKDTree
+
     #Search nearest point from 'from_coords'
     t = cKDTree(list(from_coords['xy']))
 
@@ -77,6 +85,7 @@ def polyCentroid(df, geom_col, target_col):
     return df
     
 def spatialJoin(target_df, from_df, keep_all=False, **kwargs):
+    import pandas as pd
 
     #Check that files are in the same coordinate system
     if not checkCrsMatch(target_df, from_df):
@@ -134,6 +143,8 @@ def spatialJoin(target_df, from_df, keep_all=False, **kwargs):
         return join
 
 def main():
+    import geopandas as gpd
+
     #target = r"...\Target_file.shp"
     #join = r"...\Join_file.shp"
 
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal variation of visitor activities in protected areas (Box 3).
+
+Python version of the SQL query in Box3_temporal_visitor_activities/README.md: selects the posts inside a
+bounding box whose caption mentions an activity, and counts the number of posts and users per month.
+Run with 'somecon temporal' or monthlyActivity(). Pandas is imported only when the functions are called.
+"""
+
+from somecon.profiling import StageProfiler
+
+# Posts mentioning skiing
+SKIING = '(?:ski|hiihto|cross-country|hiiht)'
+
+# Bounding box (xmin, ymin, xmax, ymax) of Pallas-Yllästunturi National Park in WGS84
+PALLAS_YLLAS = (23.3314, 67.4699, 24.7706, 68.3913)
+
+
+def readPosts(fp, x_column='x', y_column='y'):
+    """
+    Reads posts with 'photoid', 'userid', 'time_local' and 'text' columns. CSV files need to have the coordinates
+    in 'x_column' and 'y_column', other (spatial) files are read with geopandas and the coordinates are taken from
+    the point geometries.
+    """
+    if fp.lower().endswith('.csv'):
+        import pandas as pd
+        return pd.read_csv(fp)
+
+    import geopandas as gpd
+    posts = gpd.read_file(fp)
+    posts[x_column] = posts['geometry'].x
+    posts[y_column] = posts['geometry'].y
+    return posts
+
+
+def monthlyActivity(posts, pattern=SKIING, bbox=PALLAS_YLLAS, x_column='x', y_column='y'):
+    """
+    Counts the posts and users per month.
+
+    Parameters:
+    -----------
+
+    posts: DataFrame of the posts ('photoid', 'userid', 'time_local', 'text' and the coordinate columns).
+    pattern: Regular expression of the thematic content, matched against the lower case caption.
+    bbox: Spatial condition as (xmin, ymin, xmax, ymax). All posts are taken into account if None.
+
+    Returns: DataFrame with 'month', 'photocount' and 'usercount' columns
+    """
+    import pandas as pd
+
+    # Conditional statement for thematic content
+    selection = posts['text'].str.lower().str.contains(pattern, regex=True, na=False)
+
+    # Spatial condition
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        selection &= posts[x_column].between(xmin, xmax) & posts[y_column].between(ymin, ymax)
+
+    selected = posts.loc[selection]
+    month = pd.to_datetime(selected['time_local']).dt.month.rename('month')
+
+    # Count distinct posts and users per month
+    counts = selected.groupby(month).agg(photocount=('photoid', 'nunique'), usercount=('userid', 'nunique'))
+    return counts.reset_index()
+
+
+def runTemporal(input_fp, output_fp, pattern=SKIING, bbox=PALLAS_YLLAS, x_column='x', y_column='y', profiler=None):
+    """Reads the posts from 'input_fp' and writes the monthly counts to the CSV file 'output_fp'"""
+    if profiler is None:
+        profiler = StageProfiler('temporal', enabled=False)
+
+    with profiler.stage('read_posts') as stage:
+        posts = readPosts(input_fp, x_column=x_column, y_column=y_column)
+        stage.rows_out = len(posts)
+
+    with profiler.stage('monthly_activity', rows_in=len(posts)) as stage:
+        counts = monthlyActivity(posts, pattern=pattern, bbox=bbox, x_column=x_column, y_column=y_column)
+        stage.rows_out = len(counts)
+
+    with profiler.stage('write_csv', rows_in=len(counts)):
+        counts.to_csv(output_fp, index=False)
+
+    return counts
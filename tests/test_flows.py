@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('fiona')
+
+import pandas as pd  # noqa: E402
+from shapely.geometry import LineString, Point  # noqa: E402
+
+from somecon import flows  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def directLines(monkeypatch):
+    monkeypatch.setattr(flows, 'greatCircleRoute',
+                        lambda ordered_point_list, del_s=100.0: LineString([(p.x, p.y) for p in ordered_point_list]))
+
+
+def posts(rows):
+    columns = ['userid', 'time_local', 'FIPS_CNTRY', 'FromKruger', 'geometry']
+    return gpd.GeoDataFrame(pd.DataFrame(rows, columns=columns), geometry='geometry', crs=4326)
+
+
+def test_users_without_arrivals_are_skipped():
+    selected = posts([('a', '2014-01-01 10:00:00', 'FI', None, Point(25, 62)),
+                      ('a', '2014-01-05 10:00:00', 'SF', 'Kruger', Point(31.5, -24)),
+                      ('b', '2014-02-01 10:00:00', 'UK', None, Point(0, 52)),
+                      ('b', '2014-02-03 10:00:00', 'SF', 'Kruger', Point(31.6, -24))])
+    users = posts([('b', '2014-02-03 10:00:00', 'SF', 'Kruger', Point(31.6, -24))])
+
+    geo, kruger_was_first = flows.identifyFlows(selected, users, min_posts=0)
+    assert list(geo['userid']) == ['b']
+    assert list(geo['arriv_to_KNP']) == ['2014-02-03 10:00:00']
+    assert list(geo['t_difference']) == [2]
+    assert kruger_was_first == 1
+
+    geo, kruger_was_first = flows.identifyFlows(selected, users.iloc[:0], min_posts=0)
+    assert len(geo) == 0
+    assert kruger_was_first == 2
+
+
+def test_no_posts():
+    geo, kruger_was_first = flows.identifyFlows(pd.DataFrame(columns=['userid']), None)
+    assert list(geo.columns) == flows.FLOW_COLUMNS + ['Home1_cnt%', 'Home2_cnt%']
+    assert (len(geo), kruger_was_first) == (0, 0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('rtree')
+
+from shapely.geometry import Point, Polygon, box  # noqa: E402
+
+from somecon.grid_lookup import AMBIGUOUS, EMPTY, PolygonGrid, buildPolygonGrid, pointInGrid  # noqa: E402
+from somecon.spatial_tools import buildRtree, pointInPolygon  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def polygons():
+    """Boxes sharing edges, overlapping polygons, a triangle and a polygon with a hole"""
+    geoms = [box(0, 0, 1, 1), box(1, 0, 2, 1), box(0, 1, 2, 2),
+             box(2.5, 0.25, 4, 1.75), Polygon([(3, 0), (4.5, 0), (4.5, 2)]),
+             Polygon([(5, 0), (7, 0), (7, 2), (5, 2)], holes=[[(5.5, 0.5), (6.5, 0.5), (6.5, 1.5), (5.5, 1.5)]]),
+             Polygon([(0.3, 2.5), (1.7, 2.5), (1.0, 3.7)])]
+    return gpd.GeoDataFrame({'name': ['A', 'B', 'C', 'D', 'E', 'F', 'G']}, geometry=geoms, crs=4326)
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(7)
+    coords = list(zip(rng.uniform(-0.5, 7.5, 1000), rng.uniform(-0.5, 4, 1000)))
+    # Points on a lattice of 0.1 degrees: on cell edges and corners, and on the shared polygon edges
+    xs, ys = np.meshgrid(np.arange(-0.5, 7.5, 0.1), np.arange(-0.5, 4, 0.1))
+    coords += list(zip(np.round(xs.ravel(), 10), np.round(ys.ravel(), 10)))
+    # Polygon vertices
+    coords += [(1, 1), (2, 0), (4.5, 2), (5.5, 0.5), (1.0, 3.7)]
+    return gpd.GeoDataFrame(geometry=[Point(xy) for xy in coords], crs=4326)
+
+
+@pytest.fixture(scope='module')
+def expected(polygons, points):
+    return list(pointInPolygon(points.copy(), polygons, buildRtree(polygons), 'name', 'label')['label'])
+
+
+@pytest.mark.parametrize('resolution', [0.05, 0.1, 0.25, 0.3, 1.0])
+def test_point_in_grid_matches_point_in_polygon(polygons, points, expected, resolution):
+    result = pointInGrid(points.copy(), polygons, buildRtree(polygons), 'name', 'label', resolution=resolution)
+    assert sum(label is not None for label in expected) > 1000
+    assert list(result['label']) == expected
+
+
+def test_points_outside_a_partial_grid_are_tested(polygons, points, expected):
+    grid = buildPolygonGrid(polygons, resolution=0.1, bounds=(0, 0, 3, 3))
+    assert grid.outside == AMBIGUOUS
+    result = pointInGrid(points.copy(), polygons, buildRtree(polygons), 'name', 'label', grid=grid)
+    assert list(result['label']) == expected
+
+
+def test_grid_cells(polygons, tmp_path):
+    grid = buildPolygonGrid(polygons, resolution=0.1)
+    assert grid.outside == EMPTY
+    # Inside A, on the shared edge of A and B, and in the hole of F
+    assert list(grid.lookup([0.55, 1.0, 6.05], [0.55, 0.55, 1.05])) == [0, AMBIGUOUS, EMPTY]
+    assert 0 < grid.ambiguousShare() < 0.5
+
+    grid.save(str(tmp_path / 'grid.npz'))
+    loaded = PolygonGrid.load(str(tmp_path / 'grid.npz'))
+    assert (loaded.table == grid.table).all()
+    assert (loaded.bounds, loaded.resolution, loaded.fingerprint) == (grid.bounds, grid.resolution, grid.fingerprint)
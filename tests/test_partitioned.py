@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('rtree')
+pytest.importorskip('fiona')
+
+import pandas as pd  # noqa: E402
+from shapely.geometry import LineString, Point, box  # noqa: E402
+
+from somecon import flows, partitioned  # noqa: E402
+
+COUNTRIES = [('FI', box(20, 60, 30, 70)), ('SF', box(16, -35, 33, -22)), ('US', box(-120, 30, -70, 48)),
+             ('UK', box(-5, 50, 2, 58))]
+KRUGER = box(31, -25.5, 32, -22.5)
+
+
+@pytest.fixture(autouse=True)
+def directLines(monkeypatch):
+    # Basemap is not needed for the comparison: direct lines instead of Great Circles
+    monkeypatch.setattr(flows, 'greatCircleRoute',
+                        lambda ordered_point_list, del_s=100.0: LineString([(p.x, p.y) for p in ordered_point_list]))
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    """Synthetic posts, users, Kruger and country files"""
+    rng = np.random.default_rng(42)
+    path = tmp_path_factory.mktemp('data')
+
+    rows = []
+    times = pd.date_range('2009-06-01', '2016-12-31', freq='D')
+    for n in range(1500):
+        userid = 'u%02d' % rng.integers(40)
+        cntry, geom = COUNTRIES[rng.integers(len(COUNTRIES))]
+        minx, miny, maxx, maxy = geom.bounds
+        if rng.random() < 0.2:
+            cntry, (minx, miny, maxx, maxy) = 'SF', (31.2, -25, 31.8, -23)
+        point = Point(rng.uniform(minx, maxx), rng.uniform(miny, maxy))
+        # Few distinct timestamps, so that many posts of a user share the same time
+        time = times[rng.integers(0, len(times), endpoint=False) // 30 * 30]
+        rows.append((userid, time.strftime('%Y-%m-%d %H:%M:%S'), cntry, point))
+    posts = gpd.GeoDataFrame(pd.DataFrame(rows, columns=['userid', 'time_local', 'FIPS_CNTRY', 'geometry']),
+                             geometry='geometry', crs=4326)
+    users = posts.loc[posts['geometry'].within(KRUGER)]
+
+    fps = {'posts': str(path / 'posts.shp'), 'posts_nocntry': str(path / 'posts_nocntry.shp'),
+           'users': str(path / 'users.shp'), 'knp': str(path / 'knp.shp'), 'countries': str(path / 'world.shp'),
+           'posts_float': str(path / 'posts_float.shp'), 'users_int': str(path / 'users_int.shp')}
+    posts.to_file(fps['posts'])
+    posts.drop(columns='FIPS_CNTRY').to_file(fps['posts_nocntry'])
+    users.to_file(fps['users'])
+
+    # Numeric userids: float64 in the posts (as read when a userid is null) and int64 in the users
+    posts_float = posts.assign(userid=posts['userid'].str[1:].astype('float64'))
+    posts_float.loc[0, 'userid'] = None
+    posts_float.to_file(fps['posts_float'])
+    users.assign(userid=users['userid'].str[1:].astype('int64')).to_file(fps['users_int'])
+    gpd.GeoDataFrame({'NAME': ['Kruger']}, geometry=[KRUGER], crs=4326).to_file(fps['knp'])
+    gpd.GeoDataFrame({'FIPS_CNTRY': [c for c, _ in COUNTRIES]}, geometry=[g for _, g in COUNTRIES],
+                     crs=4326).to_file(fps['countries'])
+    return fps
+
+
+def assertSameFlows(expected, result):
+    assert len(expected) > 0
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result.drop(columns='geometry').reset_index(drop=True),
+                                  expected.drop(columns='geometry').reset_index(drop=True), check_dtype=False)
+    assert all(a.equals(b) for a, b in zip(result['geometry'], expected['geometry']))
+
+
+@pytest.mark.parametrize('posts, users, min_posts, scheduler', [('posts', 'users', 0, 'synchronous'),
+                                                                ('posts', 'users', 10, 'threads'),
+                                                                ('posts_nocntry', 'users', 5, 'synchronous'),
+                                                                ('posts_float', 'users_int', 5, 'synchronous')])
+def test_partitioned_flows_match_in_memory(data, tmp_path, posts, users, min_posts, scheduler):
+    expected = flows.runFlows(data[posts], data[users], data['knp'], str(tmp_path / 'flows.shp'),
+                              c_fp=data['countries'], min_posts=min_posts)
+
+    # Several chunks and partitions
+    result = partitioned.runFlowsPartitioned(data[posts], data[users], data['knp'], str(tmp_path / 'work'),
+                                             c_fp=data['countries'], min_posts=min_posts, level=2, buckets=4,
+                                             chunk_size=400, scheduler=scheduler)
+    assert len(partitioned.readPartitioned(str(tmp_path / 'work' / 'posts'))) == 1500
+    assert len([d for d in (tmp_path / 'work' / 'posts').iterdir()]) > 1
+    assertSameFlows(expected, result)
+
+    # A second run in the same directory with other partitions gives the same result
+    result = partitioned.runFlowsPartitioned(data[posts], data[users], data['knp'], str(tmp_path / 'work'),
+                                             c_fp=data['countries'], min_posts=min_posts, level=1, buckets=3,
+                                             chunk_size=700, scheduler=scheduler)
+    assertSameFlows(expected, result)
+
+
+def test_partitioned_flows_need_countries(data, tmp_path):
+    with pytest.raises(Exception, match='FIPS_CNTRY'):
+        partitioned.runFlowsPartitioned(data['posts_nocntry'], data['users'], data['knp'], str(tmp_path / 'work'))
+    assert not (tmp_path / 'work').exists()
+
+
+def test_partitioned_flows_without_posts_in_the_time_window(data, tmp_path):
+    result = partitioned.runFlowsPartitioned(data['posts'], data['users'], data['knp'], str(tmp_path / 'work'),
+                                             start_date=pd.Timestamp('2020-01-01'),
+                                             end_date=pd.Timestamp('2021-01-01'), scheduler='synchronous')
+    assert len(result) == 0
+    assert list(result.columns) == flows.FLOW_COLUMNS + ['Home1_cnt%', 'Home2_cnt%']
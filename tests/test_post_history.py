@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from somecon.post_history import PostHistory, epochSeconds  # noqa: E402
+
+
+@pytest.fixture
+def posts():
+    return pd.DataFrame({'userid': ['b', 'a', 'b', 'a', None, 'b', 'a'],
+                         'time_local': ['2015-01-02 00:00:00', '2015-01-03 00:00:00', '2015-01-01 00:00:00',
+                                        '2015-01-01 00:00:00', '2015-01-01 00:00:00', '2015-01-02 00:00:00',
+                                        '2015-01-03 00:00:00']})
+
+
+def t(value):
+    return int(epochSeconds([value])[0])
+
+
+def test_epoch_seconds():
+    assert list(epochSeconds(['1970-01-01 00:00:00', '1970-01-02 00:00:01'])) == [0, 86401]
+    assert list(epochSeconds(pd.to_datetime(['2015-01-01 02:00:00+02:00']))) == [t('2015-01-01 00:00:00')]
+
+
+def test_users_are_sorted_by_time_with_ties_in_input_order(posts):
+    history = PostHistory(posts)
+    assert len(history) == 6
+    assert list(history.users) == ['a', 'b']
+    assert list(history.order[history.userSlice('a')]) == [3, 1, 6]
+    assert list(history.order[history.userSlice('b')]) == [2, 0, 5]
+    assert list(history.times) == sorted(history.times[:3]) + sorted(history.times[3:])
+    assert history.userSlice('c') == slice(0, 0)
+    assert history.userIndex('c') is None
+    assert history.first('b') == 2
+    assert history.first('c') is None
+
+
+def test_time_windows(posts):
+    history = PostHistory(posts)
+    jan1, jan2, jan3 = t('2015-01-01'), t('2015-01-02'), t('2015-01-03')
+
+    assert list(history.order[history.window('b', start=jan2)]) == [0, 5]
+    assert list(history.order[history.window('b', end=jan1)]) == [2]
+    assert list(history.order[history.window('a', start=jan2, end=jan3)]) == [1, 6]
+    assert list(history.order[history.window('a', start=jan3 + 1)]) == []
+    assert list(history.order[history.window('a', start=jan3, end=jan1)]) == []
+    assert list(history.order[history.window('c', start=jan1)]) == []
+
+    assert history.firstAtOrAfter('a', jan2) == 1
+    assert history.firstAtOrAfter('b', jan2) == 0
+    assert history.firstAtOrAfter('b', jan3) is None
+    assert history.lastBefore('a', jan3) == 3
+    assert history.lastBefore('b', jan3) == 5
+    assert history.lastBefore('b', jan1) is None
+    assert history.lastBefore('c', jan3) is None
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from somecon.profiling import StageProfiler
+
+
+def test_close_stops_tracemalloc_started_by_the_profiler():
+    assert not tracemalloc.is_tracing()
+    with StageProfiler('test', trace_memory=True, sample_interval=0.001) as profiler:
+        with profiler.stage('allocate') as stage:
+            data = [str(i) for i in range(10000)]
+            stage.rows_out = len(data)
+        assert tracemalloc.is_tracing()
+        assert profiler.sampler._thread is not None
+    assert not tracemalloc.is_tracing()
+    assert profiler.sampler._thread is None
+    assert profiler.report()['stages'][0]['heap_peak_bytes'] > 0
+
+
+def test_close_keeps_tracemalloc_started_elsewhere():
+    tracemalloc.start()
+    try:
+        profiler = StageProfiler('test', trace_memory=True)
+        with profiler.stage('allocate'):
+            pass
+        profiler.close()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def runPipeline(profiler):
+    """A user loop with a nested stage entered once per user"""
+    with profiler.stage('read') as stage:
+        stage.rows_out = 10
+    with profiler.stage('user_loop', rows_in=10) as stage:
+        for _ in range(3):
+            with profiler.stage('great_circles', rows_in=1):
+                time.sleep(0.001)
+        stage.rows_out = 3
+
+
+def test_report_aggregates_repeated_and_nested_stages():
+    profiler = StageProfiler('flows')
+    runPipeline(profiler)
+    report = profiler.report()
+
+    assert report['pipeline'] == 'flows'
+    stages = {s['stage']: s for s in report['stages']}
+    # Stages are listed in the order they were entered
+    assert [s['stage'] for s in report['stages']] == ['read', 'user_loop', 'great_circles']
+    assert (stages['read']['calls'], stages['read']['rows_in'], stages['read']['rows_out']) == (1, None, 10)
+    assert (stages['user_loop']['calls'], stages['user_loop']['rows_in'], stages['user_loop']['rows_out']) == (1, 10, 3)
+    assert (stages['great_circles']['calls'], stages['great_circles']['rows_in']) == (3, 3)
+    assert stages['great_circles']['wall_seconds'] >= 0.003
+    assert stages['user_loop']['wall_seconds'] >= stages['great_circles']['wall_seconds']
+    for s in stages.values():
+        rows = s['rows_in'] if s['rows_in'] is not None else s['rows_out']
+        assert s['rows_per_sec'] == pytest.approx(rows / s['wall_seconds'])
+
+
+def test_prometheus_report():
+    profiler = StageProfiler('flows')
+    runPipeline(profiler)
+    lines = profiler.toPrometheus().splitlines()
+
+    assert '# TYPE pipeline_stage_wall_seconds gauge' in lines
+    assert 'pipeline_stage_calls{pipeline="flows",stage="great_circles"} 3.0' in lines
+    assert 'pipeline_stage_rows_in{pipeline="flows",stage="user_loop"} 10.0' in lines
+    assert 'pipeline_stage_rows_out{pipeline="flows",stage="read"} 10.0' in lines
+    # Metrics without values are left out
+    assert not any(line.startswith('pipeline_stage_rows_in{pipeline="flows",stage="read"}') for line in lines)
+    assert not any('heap_peak_bytes' in line for line in lines)
+
+
+def test_write_report_format_from_extension(tmp_path):
+    profiler = StageProfiler('flows', output=str(tmp_path / 'profile.json'))
+    runPipeline(profiler)
+
+    assert profiler.writeReport() == str(tmp_path / 'profile.json')
+    report = json.loads((tmp_path / 'profile.json').read_text())
+    assert [s['stage'] for s in report['stages']] == ['read', 'user_loop', 'great_circles']
+
+    for name in ['profile.prom', 'profile.txt']:
+        profiler.writeReport(str(tmp_path / name))
+        assert (tmp_path / name).read_text() == profiler.toPrometheus()
+
+
+def test_disabled_profiler_records_and_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.delenv('STAGE_PROFILE', raising=False)
+    profiler = StageProfiler.fromEnvironment('flows')
+    assert not profiler.enabled
+    runPipeline(profiler)
+    assert profiler.report()['stages'] == []
+    assert profiler.writeReport(str(tmp_path / 'profile.json')) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiler_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('STAGE_PROFILE', str(tmp_path / 'profile.prom'))
+    profiler = StageProfiler.fromEnvironment('flows')
+    runPipeline(profiler)
+    profiler.writeReport()
+    assert (tmp_path / 'profile.prom').read_text().startswith('# HELP pipeline_stage_wall_seconds')
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import pytest
+
+from somecon.temporal import monthlyActivity
+
+pd = pytest.importorskip('pandas')
+
+
+def test_monthly_activity_counts_posts_and_users():
+    posts = pd.DataFrame({'photoid': [1, 2, 3, 4, 5],
+                          'userid': ['a', 'a', 'b', 'c', 'c'],
+                          'time_local': ['2015-01-03', '2015-01-20', '2015-01-21', '2015-02-01', '2015-03-01'],
+                          'text': ['Skiing!', 'hiihtoa', None, 'Cross-country day', 'hiking'],
+                          'x': [24.0, 24.0, 24.0, 24.0, 24.0],
+                          'y': [68.0, 68.0, 68.0, 68.0, 68.0]})
+    with warnings.catch_warnings():
+        # The default pattern must not have match groups (pandas warns about them)
+        warnings.simplefilter('error')
+        counts = monthlyActivity(posts)
+    assert counts.to_dict('list') == {'month': [1, 2], 'photocount': [2, 1], 'usercount': [1, 1]}